@@ -1,22 +1,34 @@
 """
 Structured JSON logging utilities for the Lyftr AI webhook API.
 """
-import json
+import atexit
 import logging
+import os
+import queue
 import sys
-import uuid
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any, Optional
+
+import orjson
+
 from app.config import config
 
 
+# Naive datetimes are UTC; emit them with a "Z" suffix
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+# Size of the write buffer in front of stdout
+_STDOUT_BUFFER_SIZE = 8192
+
+
 class JSONFormatter(logging.Formatter):
     """Custom formatter that outputs JSON per line."""
     
     def format(self, record: logging.LogRecord) -> str:
         """Format log record as JSON."""
         log_data = {
-            "ts": datetime.utcnow().isoformat() + "Z",
+            "ts": datetime.utcfromtimestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -44,25 +56,106 @@ class JSONFormatter(logging.Formatter):
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
         
-        return json.dumps(log_data)
+        return orjson.dumps(log_data, option=_ORJSON_OPTIONS).decode()
+
+
+class _PassthroughQueueHandler(QueueHandler):
+    """Queue records untouched so all formatting runs on the listener thread."""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _DeferredFlushStreamHandler(logging.StreamHandler):
+    """Stream handler that leaves flushing to the listener."""
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class _BatchingQueueListener(QueueListener):
+    """
+    Queue listener that flushes its handlers only once the queue is drained,
+    so a burst of records is written to stdout with as few syscalls as possible.
+    """
+    
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        if block and self.queue.empty():
+            self._flush_handlers()
+        return self.queue.get(block)
+    
+    def stop(self) -> None:
+        super().stop()
+        self._flush_handlers()
+    
+    def _flush_handlers(self) -> None:
+        for handler in self.handlers:
+            handler.flush()
+
+
+def _open_log_stream():
+    """Open a buffered text stream on the stdout file descriptor."""
+    try:
+        return open(
+            sys.stdout.fileno(),
+            "w",
+            buffering=_STDOUT_BUFFER_SIZE,
+            encoding="utf-8",
+            closefd=False,
+        )
+    except (AttributeError, OSError, ValueError):
+        # stdout has been replaced by something without a real fd
+        return sys.stdout
+
+
+# Background listener that owns the real stdout handler
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    """Flush queued records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 
 def setup_logging() -> logging.Logger:
-    """Set up structured JSON logging."""
+    """
+    Set up structured JSON logging.
+    Records are queued on the request path and formatted/written to
+    stdout by a background QueueListener thread, which flushes the
+    buffered stream whenever the queue runs empty.
+    """
     logger = logging.getLogger("lyftr-api")
     logger.setLevel(config.LOG_LEVEL)
     
-    # Remove existing handlers
+    # Remove existing handlers and stop any previous listener
     logger.handlers = []
+    _stop_listener()
     
-    # JSON handler for stdout
-    handler = logging.StreamHandler(sys.stdout)
+    # Buffered JSON handler for stdout, driven by the listener thread
+    handler = _DeferredFlushStreamHandler(_open_log_stream())
     handler.setFormatter(JSONFormatter())
-    logger.addHandler(handler)
+    
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(_PassthroughQueueHandler(log_queue))
+    
+    global _listener
+    _listener = _BatchingQueueListener(log_queue, handler)
+    _listener.start()
     
     return logger
 
 
+atexit.register(_stop_listener)
+
+
 def get_logger() -> logging.Logger:
     """Get the configured logger."""
     return logging.getLogger("lyftr-api")
@@ -84,13 +177,17 @@ class LogContext:
         **kwargs: Any,
     ) -> None:
         """Log an HTTP request with context."""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
+        # Message args are interpolated later, on the listener thread
         record = self.logger.makeRecord(
             name="lyftr-api",
             level=logging.INFO,
             fn="",
             lno=0,
-            msg=f"{method} {path} {status}",
-            args=(),
+            msg="%s %s %s",
+            args=(method, path, status),
             exc_info=None,
         )
         record.request_id = request_id
@@ -115,13 +212,17 @@ class LogContext:
         latency_ms: float,
     ) -> None:
         """Log a webhook request with specific context."""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
+        # Message args are interpolated later, on the listener thread
         record = self.logger.makeRecord(
             name="lyftr-api",
             level=logging.INFO,
             fn="",
             lno=0,
-            msg=f"POST /webhook {status}",
-            args=(),
+            msg="POST /webhook %s",
+            args=(status,),
             exc_info=None,
         )
         record.request_id = request_id
@@ -137,5 +238,5 @@ class LogContext:
 
 
 def create_request_id() -> str:
-    """Create a unique request ID."""
-    return str(uuid.uuid4())
+    """Create a unique request ID (128 random bits as 32 hex chars)."""
+    return os.urandom(16).hex()
@@ -1,59 +1,52 @@
 """
 Webhook API - handles WhatsApp-like messages with signature verification.
 """
+import asyncio
 import hashlib
 import hmac
-import re
 import time
 from datetime import datetime
-from typing import Optional
+from typing import Annotated, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request, Query, Header
-from fastapi.responses import PlainTextResponse, JSONResponse
-from pydantic import BaseModel, Field, validator
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, ValidationError
 
 from app.config import config
 from app.models import init_db, check_db_health
-from app.storage import MessageStorage
+from app.storage import MessageStorage, get_write_batcher
 from app.logging_utils import setup_logging, get_logger, LogContext, create_request_id
 from app.metrics import get_metrics
 
 
+# Bodies larger than this are signed in a worker thread so hashing does not
+# stall the event loop (OpenSSL releases the GIL while hashing large buffers)
+_HMAC_OFFLOAD_THRESHOLD = 32 * 1024
+
+
+# Validated string types (patterns are checked inside pydantic-core)
+E164Str = Annotated[str, StringConstraints(pattern=r'^\+\d+$')]
+UTCTimestampStr = Annotated[
+    str,
+    StringConstraints(pattern=r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$'),
+]
+
+
 # Models for requests/responses
 
 class MessageRequest(BaseModel):
     """Incoming message"""
+    model_config = ConfigDict(populate_by_name=True)
+    
     message_id: str = Field(..., min_length=1)
-    from_msisdn: str = Field(..., alias="from")
-    to_msisdn: str = Field(..., alias="to")
-    ts: str = Field(...)
+    # E.164: + followed by digits
+    from_msisdn: E164Str = Field(..., alias="from")
+    to_msisdn: E164Str = Field(..., alias="to")
+    # ISO-8601 UTC with Z suffix
+    ts: UTCTimestampStr = Field(...)
     text: Optional[str] = Field(None, max_length=4096)
-    
-    @validator("from_msisdn", pre=True)
-    def validate_from(cls, v):
-        if not isinstance(v, str):
-            raise ValueError("from must be a string")
-        if not re.match(r'^\+\d+$', v):
-            raise ValueError("from must be in E.164 format (+ followed by digits)")
-        return v
-    
-    @validator("to_msisdn")
-    def validate_to(cls, v):
-        if not re.match(r'^\+\d+$', v):
-            raise ValueError("to must be in E.164 format (+ followed by digits)")
-        return v
-    
-    @validator("ts")
-    def validate_ts(cls, v):
-        # Must be ISO-8601 UTC with Z suffix
-        if not re.match(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$', v):
-            raise ValueError("ts must be ISO-8601 UTC format with Z suffix")
-        return v
-    
-    class Config:
-        populate_by_name = True
-        by_alias = True
 
 
 class WebhookResponse(BaseModel):
@@ -63,14 +56,13 @@ class WebhookResponse(BaseModel):
 
 class MessageData(BaseModel):
     """Single message in listing."""
+    model_config = ConfigDict(populate_by_name=True)
+    
     message_id: str
     from_msisdn: str = Field(alias="from")
     to_msisdn: str = Field(alias="to")
     ts: str
     text: Optional[str] = None
-    
-    class Config:
-        populate_by_name = True
 
 
 class MessagesResponse(BaseModel):
@@ -97,24 +89,38 @@ class StatsResponse(BaseModel):
 logger = None
 log_context = None
 metrics = None
+write_batcher = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Run on startup/shutdown"""
-    global logger, log_context, metrics
+    global logger, log_context, metrics, write_batcher
     
     # Start
     init_db()
     logger = setup_logging()
     log_context = LogContext(logger)
     metrics = get_metrics()
+    write_batcher = get_write_batcher()
+    write_batcher.start()
+    
+    # Key the HMAC once; each request copies this instead of re-deriving it
+    if config.WEBHOOK_SECRET:
+        app.state.hmac_template = hmac.new(
+            config.WEBHOOK_SECRET.encode(),
+            b"",
+            hashlib.sha256,
+        )
+    else:
+        app.state.hmac_template = None
     
     logger.info("Application startup complete")
     
     yield
     
     # Stop
+    await write_batcher.stop()
     logger.info("Application shutdown")
 
 
@@ -124,9 +130,17 @@ app = FastAPI(
     version=config.API_VERSION,
     description=config.API_DESCRIPTION,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
+def _compute_signature(hmac_template, raw_body: bytes) -> str:
+    """Compute the hex HMAC-SHA256 of raw_body from a pre-keyed template."""
+    mac = hmac_template.copy()
+    mac.update(raw_body)
+    return mac.hexdigest()
+
+
 # Middleware to track requests and timing
 
 @app.middleware("http")
@@ -139,15 +153,18 @@ async def request_timing_middleware(request: Request, call_next):
     response = await call_next(request)
     latency_ms = (time.time() - start_time) * 1000
     
+    # Raw path string from the ASGI scope; request.url would build a URL object
+    path = request.scope["path"]
+    
     # Save metrics
-    metrics.record_http_request(request.url.path, response.status_code)
+    metrics.record_http_request(path, response.status_code)
     metrics.record_latency(latency_ms)
     
     # Log it
     log_context.log_request(
         request_id=request_id,
         method=request.method,
-        path=request.url.path,
+        path=path,
         status=response.status_code,
         latency_ms=round(latency_ms, 2),
     )
@@ -157,132 +174,127 @@ async def request_timing_middleware(request: Request, call_next):
 
 # Endpoints
 
-@app.post("/webhook")
+@app.post(
+    "/webhook",
+    # The body is parsed by hand after signature verification; document it here
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": MessageRequest.model_json_schema()},
+            },
+        },
+    },
+)
 async def webhook(
     request: Request,
-    body: MessageRequest,
     x_signature: str = Header(None),
 ):
     """
     Ingest WhatsApp-like messages with HMAC signature verification.
+    The signature is checked against the raw body before it is parsed,
+    so unsigned or forged requests are rejected without any JSON work.
     """
     request_id = request.state.request_id
     start_time = time.time()
+    message_id = None
+    # Outcome, set by each branch and logged/recorded once in the finally block
+    result = None
+    status = 200
+    is_duplicate = False
     
     try:
-        message_id = body.message_id
-        
         # Get raw body for signature verification
         raw_body = await request.body()
         
         # Verify HMAC signature
         if not x_signature:
-            metrics.record_webhook_result("invalid_signature")
-            log_context.log_webhook(
-                request_id=request_id,
-                message_id=message_id,
-                is_duplicate=False,
-                result="invalid_signature",
-                status=401,
-                latency_ms=round((time.time() - start_time) * 1000, 2),
-            )
+            result, status = "invalid_signature", 401
             raise HTTPException(
                 status_code=401,
                 detail="invalid signature",
             )
         
-        # Compute expected signature
-        secret = config.WEBHOOK_SECRET.encode()
-        expected_signature = hmac.new(
-            secret,
-            raw_body,
-            hashlib.sha256,
-        ).hexdigest()
+        # Compute expected signature from the pre-keyed HMAC
+        hmac_template = request.app.state.hmac_template
+        if len(raw_body) > _HMAC_OFFLOAD_THRESHOLD:
+            expected_signature = await asyncio.to_thread(
+                _compute_signature, hmac_template, raw_body
+            )
+        else:
+            expected_signature = _compute_signature(hmac_template, raw_body)
         
         if not hmac.compare_digest(x_signature, expected_signature):
-            metrics.record_webhook_result("invalid_signature")
-            log_context.log_webhook(
-                request_id=request_id,
-                message_id=message_id,
-                is_duplicate=False,
-                result="invalid_signature",
-                status=401,
-                latency_ms=round((time.time() - start_time) * 1000, 2),
-            )
+            result, status = "invalid_signature", 401
             raise HTTPException(
                 status_code=401,
                 detail="invalid signature",
             )
         
-        # Check if message already exists (idempotency)
-        is_duplicate = MessageStorage.message_exists(message_id)
-        
-        if is_duplicate:
-            metrics.record_webhook_result("duplicate")
-            log_context.log_webhook(
-                request_id=request_id,
-                message_id=message_id,
-                is_duplicate=True,
-                result="duplicate",
-                status=200,
-                latency_ms=round((time.time() - start_time) * 1000, 2),
-            )
-            return JSONResponse(
-                status_code=200,
-                content={"status": "ok"},
+        # Parse and validate only once the signature is known to be good
+        try:
+            body = MessageRequest.model_validate_json(raw_body)
+        except ValidationError as e:
+            result, status = "validation_error", 422
+            # Same shape as FastAPI's own body validation errors
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in e.errors()]
             )
         
-        # Insert into database
-        from_msisdn = body.from_msisdn
-        success, error = MessageStorage.insert_message(
+        message_id = body.message_id
+        
+        # Insert into database; an existing message_id is ignored (idempotency)
+        success, error = await write_batcher.submit(
             message_id=message_id,
-            from_msisdn=from_msisdn,
+            from_msisdn=body.from_msisdn,
             to_msisdn=body.to_msisdn,
             ts=body.ts,
             text=body.text,
         )
         
-        if success:
-            metrics.record_webhook_result("created")
-            log_context.log_webhook(
-                request_id=request_id,
-                message_id=message_id,
-                is_duplicate=False,
-                result="created",
-                status=200,
-                latency_ms=round((time.time() - start_time) * 1000, 2),
-            )
-            return JSONResponse(
-                status_code=200,
-                content={"status": "ok"},
+        if error is not None:
+            # Not stored: answer 5xx so the sender retries
+            logger.error(f"Webhook storage error: {error}")
+            result, status = "error", 500
+            raise HTTPException(
+                status_code=500,
+                detail="failed to store message",
             )
+        
+        if success:
+            result = "created"
         else:
-            metrics.record_webhook_result("duplicate")
-            log_context.log_webhook(
-                request_id=request_id,
-                message_id=message_id,
-                is_duplicate=True,
-                result="duplicate",
-                status=200,
-                latency_ms=round((time.time() - start_time) * 1000, 2),
-            )
-            return JSONResponse(
-                status_code=200,
-                content={"status": "ok"},
-            )
+            result, is_duplicate = "duplicate", True
+        
+        return ORJSONResponse(
+            status_code=200,
+            content={"status": "ok"},
+        )
     
-    except HTTPException:
+    except (HTTPException, RequestValidationError):
         raise
     except Exception as e:
         logger.error(f"Webhook error: {str(e)}")
-        metrics.record_webhook_result("validation_error")
+        result, status = "validation_error", 422
         raise HTTPException(
             status_code=422,
             detail=str(e),
         )
+    
+    finally:
+        if result is not None:
+            metrics.record_webhook_result(result)
+            log_context.log_webhook(
+                request_id=request_id,
+                message_id=message_id,
+                is_duplicate=is_duplicate,
+                result=result,
+                status=status,
+                latency_ms=round((time.time() - start_time) * 1000, 2),
+            )
 
 
-@app.get("/messages")
+@app.get("/messages", response_model=MessagesResponse)
 async def get_messages(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
@@ -293,7 +305,7 @@ async def get_messages(
     """
     List stored messages with pagination and filtering.
     """
-    messages, total = MessageStorage.get_messages(
+    rows, total = MessageStorage.get_messages(
         limit=limit,
         offset=offset,
         from_msisdn=from_param,
@@ -302,25 +314,29 @@ async def get_messages(
     )
     
     # Convert to response format
-    data = []
-    for msg in messages:
-        data.append({
-            "message_id": msg["message_id"],
-            "from": msg["from_msisdn"],
-            "to": msg["to_msisdn"],
-            "ts": msg["ts"],
-            "text": msg["text"],
-        })
+    data = [
+        {
+            "message_id": message_id,
+            "from": from_msisdn,
+            "to": to_msisdn,
+            "ts": ts,
+            "text": text,
+        }
+        for message_id, from_msisdn, to_msisdn, ts, text in rows
+    ]
     
-    return MessagesResponse(
-        data=data,
-        total=total,
-        limit=limit,
-        offset=offset,
+    # Serialized directly with orjson; response_model only documents the shape
+    return ORJSONResponse(
+        content={
+            "data": data,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+        },
     )
 
 
-@app.get("/stats")
+@app.get("/stats", response_model=StatsResponse)
 async def get_stats():
     """
     Get analytical statistics about messages.
@@ -333,12 +349,15 @@ async def get_stats():
         for item in stats["messages_per_sender"]
     ]
     
-    return StatsResponse(
-        total_messages=stats["total_messages"],
-        senders_count=stats["senders_count"],
-        messages_per_sender=messages_per_sender,
-        first_message_ts=stats["first_message_ts"],
-        last_message_ts=stats["last_message_ts"],
+    # Serialized directly with orjson; response_model only documents the shape
+    return ORJSONResponse(
+        content={
+            "total_messages": stats["total_messages"],
+            "senders_count": stats["senders_count"],
+            "messages_per_sender": messages_per_sender,
+            "first_message_ts": stats["first_message_ts"],
+            "last_message_ts": stats["last_message_ts"],
+        },
     )
 
 
@@ -347,7 +366,7 @@ async def health_live():
     """
     Liveness probe - returns 200 when app is running.
     """
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=200,
         content={"status": "alive"},
     )
@@ -361,19 +380,19 @@ async def health_ready():
     # Check if WEBHOOK_SECRET is set
     is_valid, error_msg = config.validate()
     if not is_valid:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={"status": "not ready", "reason": error_msg},
         )
     
     # Check database health
     if not check_db_health():
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={"status": "not ready", "reason": "database not ready"},
         )
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=200,
         content={"status": "ready"},
     )
@@ -398,7 +417,7 @@ async def get_metrics_endpoint():
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions."""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
     )
@@ -408,7 +427,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions."""
     logger.error(f"Unhandled exception: {str(exc)}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Internal server error"},
     )
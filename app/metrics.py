@@ -1,8 +1,49 @@
 """
 Prometheus metrics collection for the Lyftr AI webhook API.
 """
-from typing import Dict, List
-from threading import Lock
+import time
+from bisect import bisect_left
+from typing import Dict, Hashable, List, Optional, Tuple
+from threading import Lock, local
+
+
+class _ShardedCounter:
+    """
+    Counter keyed by label values, with one shard per thread.
+    Each thread only ever writes its own shard, so increments take no lock;
+    shards are summed when the counter is read.
+    """
+    
+    def __init__(self):
+        self._local = local()
+        self._shards: List[Dict[Hashable, int]] = []
+        self._shards_lock = Lock()
+    
+    def _shard(self) -> Dict[Hashable, int]:
+        try:
+            return self._local.counts
+        except AttributeError:
+            counts: Dict[Hashable, int] = {}
+            with self._shards_lock:
+                self._shards.append(counts)
+            self._local.counts = counts
+            return counts
+    
+    def increment(self, key: Hashable) -> None:
+        """Add one to the count for key."""
+        counts = self._shard()
+        counts[key] = counts.get(key, 0) + 1
+    
+    def totals(self) -> Dict[Hashable, int]:
+        """Sum the counts for every key across all shards."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        
+        totals: Dict[Hashable, int] = {}
+        for counts in shards:
+            for key, count in list(counts.items()):
+                totals[key] = totals.get(key, 0) + count
+        return totals
 
 
 class MetricsCollector:
@@ -11,66 +52,91 @@ class MetricsCollector:
     def __init__(self):
         self._lock = Lock()
         # HTTP requests by path and status
-        self.http_requests: Dict[tuple, int] = {}
+        self.http_requests = _ShardedCounter()
         # Webhook results
-        self.webhook_requests: Dict[str, int] = {}
+        self.webhook_requests = _ShardedCounter()
         # Request latency buckets (in milliseconds)
         self.latency_buckets = [10, 50, 100, 500, 1000, 5000]
-        self.request_latencies: List[float] = []
+        # Per-bucket (non-cumulative) counts; the last slot is the +Inf overflow
+        self._bucket_counts: List[int] = [0] * (len(self.latency_buckets) + 1)
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        # Rendered exposition output, cached as (monotonic time, bytes)
+        self.cache_ttl_s = 1.0
+        self._cached: Optional[Tuple[float, bytes]] = None
     
     def record_http_request(self, path: str, status: int) -> None:
         """Record an HTTP request metric."""
-        with self._lock:
-            key = (path, status)
-            self.http_requests[key] = self.http_requests.get(key, 0) + 1
+        self.http_requests.increment((path, status))
     
     def record_webhook_result(self, result: str) -> None:
         """Record a webhook processing result."""
-        with self._lock:
-            self.webhook_requests[result] = self.webhook_requests.get(result, 0) + 1
+        self.webhook_requests.increment(result)
     
     def record_latency(self, latency_ms: float) -> None:
         """Record request latency."""
+        # First bucket whose upper bound is >= latency_ms (Prometheus "le")
+        index = bisect_left(self.latency_buckets, latency_ms)
         with self._lock:
-            self.request_latencies.append(latency_ms)
+            self._bucket_counts[index] += 1
+            self._latency_sum += latency_ms
+            self._latency_count += 1
+    
+    def get_prometheus_metrics(self) -> bytes:
+        """
+        Generate Prometheus exposition format metrics.
+        The rendered output is reused for cache_ttl_s seconds, so
+        back-to-back scrapes do not rebuild it.
+        """
+        now = time.monotonic()
+        cached = self._cached
+        if cached is not None and now - cached[0] < self.cache_ttl_s:
+            return cached[1]
+        
+        rendered = self._render().encode()
+        self._cached = (now, rendered)
+        return rendered
     
-    def get_prometheus_metrics(self) -> str:
-        """Generate Prometheus exposition format metrics."""
+    def _render(self) -> str:
+        """Render all metrics as exposition text."""
+        # Snapshot the histogram under the lock; format everything outside it
         with self._lock:
-            lines = []
-            
-            # HTTP requests total
-            lines.append("# HELP http_requests_total Total HTTP requests by path and status")
-            lines.append("# TYPE http_requests_total counter")
-            for (path, status), count in sorted(self.http_requests.items()):
-                lines.append(f'http_requests_total{{path="{path}",status="{status}"}} {count}')
-            
-            lines.append("")
-            
-            # Webhook requests total
-            lines.append("# HELP webhook_requests_total Total webhook requests by result")
-            lines.append("# TYPE webhook_requests_total counter")
-            for result, count in sorted(self.webhook_requests.items()):
-                lines.append(f'webhook_requests_total{{result="{result}"}} {count}')
-            
-            lines.append("")
-            
-            # Request latency histograms
-            lines.append("# HELP request_latency_ms Request latency in milliseconds")
-            lines.append("# TYPE request_latency_ms histogram")
-            
-            total_latency = sum(self.request_latencies)
-            count = len(self.request_latencies)
-            
-            for bucket in self.latency_buckets:
-                bucket_count = sum(1 for l in self.request_latencies if l <= bucket)
-                lines.append(f"request_latency_ms_bucket{{le=\"{bucket}\"}} {bucket_count}")
-            
-            lines.append(f'request_latency_ms_bucket{{le="+Inf"}} {count}')
-            lines.append(f"request_latency_ms_sum {total_latency}")
-            lines.append(f"request_latency_ms_count {count}")
-            
-            return "\n".join(lines) + "\n"
+            bucket_counts = list(self._bucket_counts)
+            total_latency = self._latency_sum
+            count = self._latency_count
+        
+        lines = []
+        
+        # HTTP requests total
+        lines.append("# HELP http_requests_total Total HTTP requests by path and status")
+        lines.append("# TYPE http_requests_total counter")
+        for (path, status), requests in sorted(self.http_requests.totals().items()):
+            lines.append(f'http_requests_total{{path="{path}",status="{status}"}} {requests}')
+        
+        lines.append("")
+        
+        # Webhook requests total
+        lines.append("# HELP webhook_requests_total Total webhook requests by result")
+        lines.append("# TYPE webhook_requests_total counter")
+        for result, requests in sorted(self.webhook_requests.totals().items()):
+            lines.append(f'webhook_requests_total{{result="{result}"}} {requests}')
+        
+        lines.append("")
+        
+        # Request latency histograms
+        lines.append("# HELP request_latency_ms Request latency in milliseconds")
+        lines.append("# TYPE request_latency_ms histogram")
+        
+        bucket_count = 0
+        for bucket, bucket_hits in zip(self.latency_buckets, bucket_counts):
+            bucket_count += bucket_hits
+            lines.append(f"request_latency_ms_bucket{{le=\"{bucket}\"}} {bucket_count}")
+        
+        lines.append(f'request_latency_ms_bucket{{le="+Inf"}} {count}')
+        lines.append(f"request_latency_ms_sum {total_latency}")
+        lines.append(f"request_latency_ms_count {count}")
+        
+        return "\n".join(lines) + "\n"
 
 
 # Global metrics instance
@@ -2,11 +2,42 @@
 Database models and schema initialization for the Lyftr AI webhook API.
 """
 import sqlite3
+import threading
 from pathlib import Path
 from typing import Optional
 from app.config import config
 
 
+# Shared connection, opened once and reused by every storage call
+_conn: Optional[sqlite3.Connection] = None
+_conn_path: Optional[str] = None
+_conn_lock = threading.Lock()
+
+# Serializes write statements on the shared connection
+db_write_lock = threading.Lock()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """Open the shared connection and apply per-connection settings."""
+    conn = sqlite3.connect(
+        db_path,
+        check_same_thread=False,
+        isolation_level=None,  # autocommit; each statement is its own transaction
+    )
+    conn.row_factory = sqlite3.Row  # Enable column access by name
+    
+    # WAL + NORMAL sync: no fsync per commit, only at checkpoints. The last
+    # few writes may be lost on power failure, which is acceptable since
+    # webhook ingest is idempotent and senders retry.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    return conn
+
+
 def init_db() -> None:
     """Initialize the database schema."""
     db_path = config.get_db_path()
@@ -15,7 +46,7 @@ def init_db() -> None:
     db_file = Path(db_path)
     db_file.parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Create messages table with PRIMARY KEY on message_id for uniqueness
@@ -36,22 +67,29 @@ def init_db() -> None:
         ON messages(ts ASC, message_id ASC)
     """)
     
-    # Create index on from_msisdn for filtering
+    # Index for filtering by sender; also covers the listing sort order so
+    # /messages?from=... is a range scan with no separate sort step
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_messages_from
-        ON messages(from_msisdn)
+        CREATE INDEX IF NOT EXISTS idx_messages_from_ts
+        ON messages(from_msisdn, ts ASC, message_id ASC)
     """)
     
-    conn.commit()
-    conn.close()
+    # Superseded by idx_messages_from_ts (from_msisdn is its leading column)
+    cursor.execute("DROP INDEX IF EXISTS idx_messages_from")
 
 
 def get_db_connection() -> sqlite3.Connection:
-    """Get a database connection."""
+    """Get the shared database connection, opening it on first use."""
+    global _conn, _conn_path
     db_path = config.get_db_path()
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row  # Enable column access by name
-    return conn
+    
+    with _conn_lock:
+        if _conn is None or _conn_path != db_path:
+            if _conn is not None:
+                _conn.close()
+            _conn = _connect(db_path)
+            _conn_path = db_path
+        return _conn
 
 
 def check_db_health() -> bool:
@@ -60,7 +98,7 @@ def check_db_health() -> bool:
         db_path = config.get_db_path()
         
         # Check if database file exists and is accessible
-        if not Path(db_path).exists():
+        if db_path != ":memory:" and not Path(db_path).exists():
             return False
         
         conn = get_db_connection()
@@ -73,7 +111,6 @@ def check_db_health() -> bool:
         """)
         
         result = cursor.fetchone()
-        conn.close()
         
         return result is not None
     except Exception:
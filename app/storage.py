@@ -2,9 +2,37 @@
 Storage layer for database operations.
 Handles message insertion, retrieval, and aggregation.
 """
-from datetime import datetime
+import asyncio
+import time
 from typing import Any, Optional
-from app.models import get_db_connection
+from app.models import get_db_connection, db_write_lock
+
+
+# Kept as a single constant so sqlite3's statement cache reuses the
+# prepared statement across calls on the shared connection
+_INSERT_MESSAGE_SQL = """
+    INSERT OR IGNORE INTO messages
+    (message_id, from_msisdn, to_msisdn, ts, text, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+# Last formatted created_at value as (epoch second, timestamp string)
+_created_at_cache: tuple[int, str] = (-1, "")
+
+
+def _utc_now_ts() -> str:
+    """
+    Current UTC time as ISO-8601 with Z suffix, in the same second-precision
+    format as message ts. Formatted at most once per second.
+    """
+    global _created_at_cache
+    now = int(time.time())
+    cached_second, cached_ts = _created_at_cache
+    if now != cached_second:
+        cached_ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+        _created_at_cache = (now, cached_ts)
+    return cached_ts
 
 
 class MessageStorage:
@@ -20,49 +48,67 @@ class MessageStorage:
     ) -> tuple[bool, Optional[str]]:
         """
         Insert a new message into the database.
-        Returns: (success, error_message)
-        Handles duplicate key gracefully (idempotency).
+        Returns: (inserted, error_message)
+        A duplicate message_id is ignored and reported as inserted=False
+        (idempotency).
+        """
+        return MessageStorage.insert_messages(
+            [(message_id, from_msisdn, to_msisdn, ts, text)]
+        )[0]
+    
+    @staticmethod
+    def insert_messages(
+        rows: list[tuple[str, str, str, str, Optional[str]]],
+    ) -> list[tuple[bool, Optional[str]]]:
+        """
+        Insert several messages in a single transaction.
+        Each row is (message_id, from_msisdn, to_msisdn, ts, text).
+        Returns one (inserted, error_message) per row, in order.
+        If the batch fails, rows are retried one by one so a single bad
+        row does not fail the others.
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            created_at = datetime.utcnow().isoformat() + "Z"
-            
-            cursor.execute("""
-                INSERT INTO messages
-                (message_id, from_msisdn, to_msisdn, ts, text, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (message_id, from_msisdn, to_msisdn, ts, text, created_at))
-            
-            conn.commit()
-            conn.close()
-            
-            return True, None
-        except sqlite3.IntegrityError:
-            # Duplicate key - this is expected for idempotency
-            return False, None
+            return MessageStorage._insert_rows(rows)
         except Exception as e:
-            return False, str(e)
+            if len(rows) == 1:
+                return [(False, str(e))]
+        
+        results = []
+        for row in rows:
+            try:
+                results.extend(MessageStorage._insert_rows([row]))
+            except Exception as e:
+                results.append((False, str(e)))
+        return results
     
     @staticmethod
-    def message_exists(message_id: str) -> bool:
-        """Check if a message with the given ID already exists."""
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT 1 FROM messages WHERE message_id = ?",
-                (message_id,)
-            )
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result is not None
-        except Exception:
-            return False
+    def _insert_rows(
+        rows: list[tuple[str, str, str, str, Optional[str]]],
+    ) -> list[tuple[bool, Optional[str]]]:
+        """Insert rows inside one savepoint; raises if any row fails."""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        created_at = _utc_now_ts()
+        results = []
+        
+        with db_write_lock:
+            # A savepoint behaves as BEGIN/COMMIT at the top level and
+            # nests cleanly if a transaction is already open
+            cursor.execute("SAVEPOINT insert_messages")
+            try:
+                # Rows are executed one by one so each gets its own
+                # rowcount; the single commit is what amortizes the cost
+                for row in rows:
+                    cursor.execute(_INSERT_MESSAGE_SQL, (*row, created_at))
+                    results.append((cursor.rowcount == 1, None))
+                cursor.execute("RELEASE insert_messages")
+            except Exception:
+                cursor.execute("ROLLBACK TO insert_messages")
+                cursor.execute("RELEASE insert_messages")
+                raise
+        
+        return results
     
     @staticmethod
     def get_messages(
@@ -71,14 +117,16 @@ class MessageStorage:
         from_msisdn: Optional[str] = None,
         since: Optional[str] = None,
         q: Optional[str] = None,
-    ) -> tuple[list[dict[str, Any]], int]:
+    ) -> tuple[list[tuple], int]:
         """
         Retrieve messages with pagination and filters.
-        Returns: (messages_list, total_count)
+        Returns: (rows, total_count), where each row is a plain
+        (message_id, from_msisdn, to_msisdn, ts, text) tuple.
         """
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
+            cursor.row_factory = None  # plain tuples, no sqlite3.Row objects
             
             # Build WHERE clause
             where_conditions = []
@@ -101,9 +149,9 @@ class MessageStorage:
                 where_clause = " WHERE " + where_clause
             
             # Count total matching records
-            count_query = f"SELECT COUNT(*) as count FROM messages{where_clause}"
+            count_query = f"SELECT COUNT(*) FROM messages{where_clause}"
             cursor.execute(count_query, params)
-            total = cursor.fetchone()["count"]
+            total = cursor.fetchone()[0]
             
             # Fetch paginated results
             query = f"""
@@ -115,12 +163,8 @@ class MessageStorage:
             
             cursor.execute(query, params + [limit, offset])
             rows = cursor.fetchall()
-            conn.close()
-            
-            # Convert to list of dicts
-            messages = [dict(row) for row in rows]
             
-            return messages, total
+            return rows, total
         except Exception as e:
             return [], 0
     
@@ -161,8 +205,6 @@ class MessageStorage:
             first_message_ts = row["first_ts"]
             last_message_ts = row["last_ts"]
             
-            conn.close()
-            
             return {
                 "total_messages": total_messages,
                 "senders_count": senders_count,
@@ -180,4 +222,91 @@ class MessageStorage:
             }
 
 
-import sqlite3
+class _WriteBatcher:
+    """
+    Coalesces message inserts from concurrent requests into one transaction.
+    A background task takes every row already queued (up to max_batch_size)
+    and writes them with MessageStorage.insert_messages. It never waits for
+    more rows, so a lone request is written immediately; batches form from
+    the rows that pile up while the previous batch is being written.
+    """
+    
+    def __init__(self, max_batch_size: int = 100):
+        self.max_batch_size = max_batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start the writer task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Flush pending rows and stop the writer task."""
+        if self._task is None:
+            return
+        # Clear _task first so later submits write directly instead of
+        # queueing behind the stop sentinel
+        task, self._task = self._task, None
+        self._queue.put_nowait(None)
+        await task
+        self._queue = None
+    
+    async def submit(
+        self,
+        message_id: str,
+        from_msisdn: str,
+        to_msisdn: str,
+        ts: str,
+        text: Optional[str] = None,
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Queue a message for insertion and wait for its batch to commit.
+        Returns: (inserted, error_message), as MessageStorage.insert_message.
+        """
+        row = (message_id, from_msisdn, to_msisdn, ts, text)
+        if self._task is None:
+            # Writer not running (e.g. outside the app lifespan)
+            return MessageStorage.insert_messages([row])[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+    
+    async def _run(self) -> None:
+        stopping = False
+        
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._flush(batch)
+    
+    @staticmethod
+    def _flush(batch: list) -> None:
+        results = MessageStorage.insert_messages([row for row, _ in batch])
+        for (_, future), result in zip(batch, results):
+            # The submitter may have gone away (e.g. client disconnect)
+            if not future.done():
+                future.set_result(result)
+
+
+# Global write batcher instance
+write_batcher = _WriteBatcher()
+
+
+def get_write_batcher() -> _WriteBatcher:
+    """Get the global write batcher."""
+    return write_batcher
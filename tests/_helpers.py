@@ -0,0 +1,64 @@
+"""
+Shared helpers for signing and posting webhook messages in tests.
+"""
+import hmac
+from functools import lru_cache
+
+import orjson
+
+
+WEBHOOK_SECRET = "testsecret"
+
+
+def dumps_body(body: dict) -> bytes:
+    """
+    Serialize a request body. Tests post these bytes with content=, so the
+    server verifies the signature over exactly what was signed.
+    """
+    return orjson.dumps(body)
+
+
+@lru_cache(maxsize=512)
+def _signature_for(body_bytes: bytes, secret: str) -> str:
+    """Compute HMAC-SHA256 signature of an already-serialized body."""
+    return hmac.digest(secret.encode(), body_bytes, "sha256").hex()
+
+
+def get_signature(body: dict, secret: str = WEBHOOK_SECRET) -> str:
+    """Compute HMAC-SHA256 signature of dumps_body(body), cached per body."""
+    return _signature_for(dumps_body(body), secret)
+
+
+def insert_messages_bulk(
+    client,
+    n: int,
+    id_prefix: str = "bulk-",
+    from_number: str = "+919876543210",
+) -> list[str]:
+    """
+    Insert n distinct test messages through the webhook, one second apart.
+    Returns the inserted message IDs.
+    """
+    message_ids = [f"{id_prefix}{i}" for i in range(n)]
+    bodies = [
+        dumps_body({
+            "message_id": message_id,
+            "from": from_number,
+            "to": "+14155550100",
+            "ts": f"2025-01-15T10:{i // 60:02d}:{i % 60:02d}Z",
+            "text": f"Hello {i}",
+        })
+        for i, message_id in enumerate(message_ids)
+    ]
+    for body_bytes in bodies:
+        response = client.post(
+            "/webhook",
+            content=body_bytes,
+            headers={
+                "Content-Type": "application/json",
+                "X-Signature": _signature_for(body_bytes, WEBHOOK_SECRET),
+            },
+        )
+        assert response.status_code == 200
+    
+    return message_ids
@@ -0,0 +1,70 @@
+"""
+Shared pytest fixtures.
+"""
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from tests._helpers import WEBHOOK_SECRET
+
+
+def pytest_configure(config):
+    """
+    Set test env vars before any test module imports the app.
+    Config is read at import time, so setting them later has no effect.
+    The app keeps a single shared SQLite connection, so an in-memory
+    database lives for the whole session without touching disk. Under
+    pytest-xdist every worker is its own process and so gets its own
+    private database.
+    """
+    os.environ.setdefault("WEBHOOK_SECRET", WEBHOOK_SECRET)
+    os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient (and app lifespan) shared by the whole test session."""
+    # Imported lazily: conftest itself loads before pytest_configure runs
+    from app.main import app
+    
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def _rollback_db(client):
+    """Run each test inside a savepoint and roll its writes back afterwards."""
+    from app.models import db_write_lock, get_db_connection
+    
+    conn = get_db_connection()
+    with db_write_lock:
+        conn.execute("SAVEPOINT test_case")
+    
+    yield
+    
+    with db_write_lock:
+        conn.execute("ROLLBACK TO test_case")
+        conn.execute("RELEASE test_case")
+
+
+@pytest.fixture
+def poison_message_id(client):
+    """
+    A message_id whose insert fails, via a temporary trigger that aborts
+    any INSERT carrying it. Used to exercise storage error paths.
+    """
+    from app.models import db_write_lock, get_db_connection
+    
+    message_id = "poison"
+    conn = get_db_connection()
+    with db_write_lock:
+        conn.execute(
+            "CREATE TEMP TRIGGER poison_insert BEFORE INSERT ON messages "
+            f"WHEN NEW.message_id = '{message_id}' "
+            "BEGIN SELECT RAISE(ABORT, 'poisoned row'); END"
+        )
+    
+    yield message_id
+    
+    with db_write_lock:
+        conn.execute("DROP TRIGGER IF EXISTS poison_insert")
@@ -1,50 +1,32 @@
 """
 Tests for messages listing and filtering.
 """
-import json
-import hashlib
-import hmac
-from fastapi.testclient import TestClient
-from app.main import app
-
-
-client = TestClient(app)
-
-WEBHOOK_SECRET = "testsecret"
-
-
-def get_signature(body: dict, secret: str) -> str:
-    """Compute HMAC-SHA256 signature."""
-    body_bytes = json.dumps(body).encode()
-    return hmac.new(
-        secret.encode(),
-        body_bytes,
-        hashlib.sha256,
-    ).hexdigest()
-
-
-def insert_message(message_id: str, from_number: str = "+919876543210", text: str = "Hello"):
-    """Helper to insert a test message."""
-    body = {
-        "message_id": message_id,
-        "from": from_number,
-        "to": "+14155550100",
-        "ts": "2025-01-15T10:00:00Z",
-        "text": text,
-    }
-    signature = get_signature(body, WEBHOOK_SECRET)
+import pytest
+from tests._helpers import insert_messages_bulk
+
+
+# Enough rows for pagination to span several pages
+SEED_COUNT = 120
+SEED_FROM = "+919876543210"
+
+
+@pytest.fixture(scope="module")
+def seeded_messages(client):
+    """Seed messages once for the read-side tests, then remove them."""
+    from app.models import db_write_lock, get_db_connection
+    
+    message_ids = insert_messages_bulk(client, SEED_COUNT, from_number=SEED_FROM)
+    yield message_ids
     
-    client.post(
-        "/webhook",
-        json=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Signature": signature,
-        },
-    )
+    # Leave the shared database as we found it for other modules
+    with db_write_lock:
+        get_db_connection().executemany(
+            "DELETE FROM messages WHERE message_id = ?",
+            [(message_id,) for message_id in message_ids],
+        )
 
 
-def test_messages_list():
+def test_messages_list(client):
     """Test basic messages listing."""
     response = client.get("/messages")
     assert response.status_code == 200
@@ -55,16 +37,18 @@ def test_messages_list():
     assert "offset" in data
 
 
-def test_messages_pagination():
+def test_messages_pagination(client, seeded_messages):
     """Test pagination with limit and offset."""
     response = client.get("/messages?limit=10&offset=0")
     assert response.status_code == 200
     data = response.json()
     assert data["limit"] == 10
     assert data["offset"] == 0
+    assert len(data["data"]) == 10
+    assert data["total"] >= SEED_COUNT
 
 
-def test_messages_limit_validation():
+def test_messages_limit_validation(client):
     """Test limit validation."""
     # Test max limit
     response = client.get("/messages?limit=200")
@@ -75,25 +59,31 @@ def test_messages_limit_validation():
     assert response.status_code == 422
 
 
-def test_messages_filter_by_from():
+def test_messages_filter_by_from(client, seeded_messages):
     """Test filtering by from parameter."""
     response = client.get("/messages?from=%2B919876543210")  # URL-encoded +919876543210
     assert response.status_code == 200
     data = response.json()
     assert "data" in data
+    assert data["data"]
+    assert all(msg["from"] == SEED_FROM for msg in data["data"])
 
 
-def test_messages_filter_by_since():
+def test_messages_filter_by_since(client, seeded_messages):
     """Test filtering by since parameter."""
     response = client.get("/messages?since=2025-01-15T09:30:00Z")
     assert response.status_code == 200
     data = response.json()
     assert "data" in data
+    assert data["data"]
+    assert all(msg["ts"] >= "2025-01-15T09:30:00Z" for msg in data["data"])
 
 
-def test_messages_search_by_text():
+def test_messages_search_by_text(client, seeded_messages):
     """Test free-text search."""
     response = client.get("/messages?q=Hello")
     assert response.status_code == 200
     data = response.json()
     assert "data" in data
+    assert data["data"]
+    assert all("Hello" in msg["text"] for msg in data["data"])
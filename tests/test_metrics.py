@@ -0,0 +1,36 @@
+"""
+Tests for the metrics collector.
+"""
+from app.metrics import MetricsCollector
+
+
+def _latency_buckets(collector):
+    """Parse the request_latency_ms_bucket lines into {le: count}."""
+    buckets = {}
+    for line in collector.get_prometheus_metrics().decode().splitlines():
+        if line.startswith("request_latency_ms_bucket"):
+            name, value = line.rsplit(" ", 1)
+            le = name.split('le="', 1)[1].rstrip('"}')
+            buckets[le] = int(value)
+    return buckets
+
+
+def test_latency_histogram_buckets():
+    """Bounds are inclusive, overflow lands only in +Inf, and counts are cumulative."""
+    collector = MetricsCollector()
+    collector.record_latency(50)  # Exactly on a bound
+    collector.record_latency(6000)  # Above the largest bound
+    
+    buckets = _latency_buckets(collector)
+    
+    assert buckets == {
+        "10": 0,
+        "50": 1,
+        "100": 1,
+        "500": 1,
+        "1000": 1,
+        "5000": 1,
+        "+Inf": 2,
+    }
+    counts = list(buckets.values())
+    assert counts == sorted(counts)
@@ -1,14 +1,9 @@
 """
 Tests for analytics/stats endpoint.
 """
-from fastapi.testclient import TestClient
-from app.main import app
 
 
-client = TestClient(app)
-
-
-def test_stats_endpoint():
+def test_stats_endpoint(client):
     """Test stats endpoint returns correct structure."""
     response = client.get("/stats")
     assert response.status_code == 200
@@ -25,7 +20,7 @@ def test_stats_endpoint():
     assert isinstance(data["messages_per_sender"], list)
 
 
-def test_stats_empty_database():
+def test_stats_empty_database(client):
     """Test stats when database is empty."""
     response = client.get("/stats")
     assert response.status_code == 200
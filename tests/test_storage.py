@@ -0,0 +1,75 @@
+"""
+Tests for the write batcher.
+"""
+import asyncio
+
+from app.storage import MessageStorage, _WriteBatcher
+
+
+def _row(message_id):
+    return (message_id, "+919876543210", "+14155550100", "2025-01-15T10:00:00Z", "Hello")
+
+
+def _stored_ids():
+    rows, _ = MessageStorage.get_messages(limit=100)
+    return {row[0] for row in rows}
+
+
+async def _with_batcher(coro_fn):
+    batcher = _WriteBatcher()
+    batcher.start()
+    try:
+        return await coro_fn(batcher)
+    finally:
+        await batcher.stop()
+
+
+def test_batcher_concurrent_duplicate_submits():
+    """Two concurrent submits of one message_id: one inserts, one is a duplicate."""
+    async def run(batcher):
+        return await asyncio.gather(
+            batcher.submit(*_row("dup-1")),
+            batcher.submit(*_row("dup-1")),
+        )
+    
+    results = asyncio.run(_with_batcher(run))
+    
+    assert sorted(results) == [(False, None), (True, None)]
+    assert "dup-1" in _stored_ids()
+
+
+def test_batcher_stop_commits_queued_rows():
+    """Rows still queued when stop() is called are written before it returns."""
+    async def run():
+        batcher = _WriteBatcher()
+        batcher.start()
+        tasks = [asyncio.create_task(batcher.submit(*_row(f"q-{i}"))) for i in range(3)]
+        # Let the submits enqueue, but not the writer pick them up
+        await asyncio.sleep(0)
+        assert batcher._queue.qsize() == 3
+        await batcher.stop()
+        return [task.result() for task in tasks]
+    
+    results = asyncio.run(run())
+    
+    assert results == [(True, None)] * 3
+    assert {"q-0", "q-1", "q-2"} <= _stored_ids()
+
+
+def test_batcher_error_isolated_to_failing_row(poison_message_id):
+    """A failing row reports its error without failing the rest of its batch."""
+    async def run(batcher):
+        return await asyncio.gather(
+            batcher.submit(*_row("ok-1")),
+            batcher.submit(*_row(poison_message_id)),
+            batcher.submit(*_row("ok-2")),
+        )
+    
+    ok1, poisoned, ok2 = asyncio.run(_with_batcher(run))
+    
+    assert ok1 == (True, None)
+    assert ok2 == (True, None)
+    assert poisoned[0] is False
+    assert "poisoned row" in poisoned[1]
+    assert {"ok-1", "ok-2"} <= _stored_ids()
+    assert poison_message_id not in _stored_ids()
@@ -1,158 +1,130 @@
 """
 Tests for the webhook endpoint.
 """
-import json
-import hashlib
-import hmac
+from types import MappingProxyType
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
-from app.config import config
+from tests._helpers import _signature_for, dumps_body, get_signature, WEBHOOK_SECRET
 
 
-client = TestClient(app)
-
-WEBHOOK_SECRET = "testsecret"
-VALID_MESSAGE = {
+# Read-only so no test can mutate the shared baseline by accident
+VALID_MESSAGE = MappingProxyType({
     "message_id": "m1",
     "from": "+919876543210",
     "to": "+14155550100",
     "ts": "2025-01-15T10:00:00Z",
     "text": "Hello"
-}
-
-
-def get_signature(body: dict, secret: str) -> str:
-    """Compute HMAC-SHA256 signature."""
-    body_bytes = json.dumps(body).encode()
-    return hmac.new(
-        secret.encode(),
-        body_bytes,
-        hashlib.sha256,
-    ).hexdigest()
-
-
-@pytest.fixture
-def setup_env(monkeypatch):
-    """Set env vars for tests."""
-    monkeypatch.setenv("WEBHOOK_SECRET", WEBHOOK_SECRET)
-    monkeypatch.setenv("DATABASE_URL", "sqlite:////tmp/test.db")
-
-
-def test_webhook_valid_signature(setup_env):
-    """Valid signature should work"""
-    body = VALID_MESSAGE.copy()
-    signature = get_signature(body, WEBHOOK_SECRET)
+})
+
+
+# Pre-serialized body for tests that post VALID_MESSAGE unchanged; the
+# signature is computed over these exact bytes
+VALID_BODY_BYTES = dumps_body(dict(VALID_MESSAGE))
+VALID_SIGNATURE = get_signature(dict(VALID_MESSAGE), WEBHOOK_SECRET)
+
+
+# Request headers, built once and shared by every test that needs them
+_HEADERS_OK = {"Content-Type": "application/json", "X-Signature": VALID_SIGNATURE}
+_HEADERS_BAD = {"Content-Type": "application/json", "X-Signature": "invalid"}
+_HEADERS_NONE = {"Content-Type": "application/json"}
+
+
+@pytest.mark.parametrize(
+    "mutate,headers,expected",
+    [
+        (None, _HEADERS_OK, 200),
+        (None, _HEADERS_BAD, 401),
+        (None, _HEADERS_NONE, 401),
+        # headers=None: sign the mutated body
+        ({"from": "919876543210"}, None, 422),  # Missing +
+        ({"ts": "2025-01-15T10:00:00"}, None, 422),  # Missing Z
+        # Signature is checked before the payload is validated
+        ({"from": "919876543210"}, _HEADERS_BAD, 401),
+    ],
+    ids=[
+        "valid_signature",
+        "invalid_signature",
+        "missing_signature",
+        "invalid_phone_format",
+        "invalid_timestamp_format",
+        "invalid_payload_bad_signature",
+    ],
+)
+def test_webhook_variants(client, mutate, headers, expected):
+    """Signature and payload validation outcomes for a single POST."""
+    if mutate is None:
+        body_bytes = VALID_BODY_BYTES
+    else:
+        body = dict(VALID_MESSAGE, **mutate)
+        body_bytes = dumps_body(body)
     
-    response = client.post(
-        "/webhook",
-        json=body,
-        headers={
+    if headers is None:
+        headers = {
             "Content-Type": "application/json",
-            "X-Signature": signature,
-        },
-    )
+            "X-Signature": get_signature(body, WEBHOOK_SECRET),
+        }
     
-    assert response.status_code == 200
-    assert response.json()["status"] == "ok"
-
-
-def test_webhook_invalid_signature(setup_env):
-    """Bad signature should be rejected"""
-    body = VALID_MESSAGE.copy()
+    response = client.post("/webhook", content=body_bytes, headers=headers)
     
-    response = client.post(
-        "/webhook",
-        json=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Signature": "invalid",
-        },
-    )
-    
-    assert response.status_code == 401
-    assert "invalid signature" in response.json()["detail"]
-
-
-def test_webhook_missing_signature(setup_env):
-    """No signature should fail"""
-    body = VALID_MESSAGE.copy()
+    # Status first, so a wrong status fails before any body is decoded
+    assert response.status_code == expected
+    if headers is _HEADERS_OK:
+        assert response.json()["status"] == "ok"
+    elif headers is _HEADERS_BAD:
+        assert "invalid signature" in response.json()["detail"]
+
+
+def test_webhook_invalid_json(client):
+    """A correctly signed body that is not JSON is a 422 located at "body"."""
+    body_bytes = b"not json"
+    headers = {
+        "Content-Type": "application/json",
+        "X-Signature": _signature_for(body_bytes, WEBHOOK_SECRET),
+    }
     
-    response = client.post(
-        "/webhook",
-        json=body,
-        headers={"Content-Type": "application/json"},
-    )
+    response = client.post("/webhook", content=body_bytes, headers=headers)
     
-    assert response.status_code == 401
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][0] == "body"
 
 
-def test_webhook_duplicate_idempotency(setup_env):
+def test_webhook_duplicate_idempotency(client):
     """Test that duplicate messages are handled idempotently."""
-    body = VALID_MESSAGE.copy()
-    signature = get_signature(body, WEBHOOK_SECRET)
+    from app.metrics import get_metrics
+    
+    duplicates_before = get_metrics().webhook_requests.totals().get("duplicate", 0)
     
     # First request
-    response1 = client.post(
-        "/webhook",
-        json=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Signature": signature,
-        },
-    )
+    response1 = client.post("/webhook", content=VALID_BODY_BYTES, headers=_HEADERS_OK)
     assert response1.status_code == 200
     
     # Duplicate request
-    response2 = client.post(
-        "/webhook",
-        json=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Signature": signature,
-        },
-    )
+    response2 = client.post("/webhook", content=VALID_BODY_BYTES, headers=_HEADERS_OK)
     assert response2.status_code == 200
     assert response2.json()["status"] == "ok"
-
-
-def test_webhook_invalid_phone_format(setup_env):
-    """Test webhook with invalid phone number format."""
-    body = VALID_MESSAGE.copy()
-    body["from"] = "919876543210"  # Missing +
-    signature = get_signature(body, WEBHOOK_SECRET)
     
-    response = client.post(
-        "/webhook",
-        json=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Signature": signature,
-        },
-    )
-    
-    assert response.status_code == 422
+    # The second post is classified as a duplicate and stored only once
+    assert get_metrics().webhook_requests.totals().get("duplicate", 0) == duplicates_before + 1
+    assert client.get("/messages").json()["total"] == 1
 
 
-def test_webhook_invalid_timestamp_format(setup_env):
-    """Test webhook with invalid timestamp format."""
-    body = VALID_MESSAGE.copy()
-    body["ts"] = "2025-01-15T10:00:00"  # Missing Z
-    signature = get_signature(body, WEBHOOK_SECRET)
+def test_webhook_storage_error(client, poison_message_id):
+    """A message that fails to store is answered 5xx and counted as an error."""
+    from app.metrics import get_metrics
     
-    response = client.post(
-        "/webhook",
-        json=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Signature": signature,
-        },
-    )
+    body = dict(VALID_MESSAGE, message_id=poison_message_id)
+    headers = {
+        "Content-Type": "application/json",
+        "X-Signature": get_signature(body, WEBHOOK_SECRET),
+    }
+    errors_before = get_metrics().webhook_requests.totals().get("error", 0)
     
-    assert response.status_code == 422
+    response = client.post("/webhook", content=dumps_body(body), headers=headers)
+    
+    assert response.status_code == 500
+    assert get_metrics().webhook_requests.totals().get("error", 0) == errors_before + 1
 
 
-def test_health_live(setup_env):
+def test_health_live(client):
     """Test liveness probe."""
     response = client.get("/health/live")
     assert response.status_code == 200